@@ -1,121 +1,36 @@
 import pickle
+import joblib
 import shap
+import lightgbm as lgb
 import numpy as np
 import pandas as pd
 import streamlit as st
+import httpx
 from groq import Groq
 import json
 import logging
+import traceback
+import functools
+from collections import defaultdict
+import requests
+from requests.adapters import HTTPAdapter
 from backend.config import GROQ_API_KEY
 
+try:
+    import fasttreeshap
+except ImportError:
+    fasttreeshap = None
 
-# Setup basic logging
-# logging.basicConfig(filename='app.log', level=logging.ERROR, format='%(asctime)s %(levelname)s:%(message)s')
-
-
-class LoanInsightsGenerator:
-    def __init__(self):
-        # Debug: Check if API key is loaded
-        if not GROQ_API_KEY:
-            pass  # Could raise an error or warning if desired
-        try:
-            self.client = Groq(api_key=GROQ_API_KEY)
-        except Exception as e:
-            pass  # Could raise/log error if desired
-
-    def generate_shap_insights(self, model, X):
-        try:
-            # Extensive error checking
-            if model is None:
-                st.error("Model is None. Cannot generate SHAP insights.")
-                return {}
-
-            if X is None or len(X) == 0:
-                st.error("Input data is empty or None. Cannot generate SHAP insights.")
-                return {}
-
-            # Extract the final estimator from the pipeline
-            if hasattr(model, 'named_steps'):
-                # Find the classifier step
-                classifier_key = None
-                for key, step in model.named_steps.items():
-                    if hasattr(step, 'predict_proba'):
-                        classifier_key = key
-                        break
-
-                if classifier_key is None:
-                    st.error("No classifier found in the pipeline")
-                    return {}
-
-                final_estimator = model.named_steps[classifier_key]
-            else:
-                final_estimator = model
-
-            # Ensure transformed features for SHAP
-            if hasattr(model, 'named_steps'):
-                # Find the preprocessor step
-                preprocessor_key = None
-                for key, step in model.named_steps.items():
-                    if hasattr(step, 'transform'):
-                        preprocessor_key = key
-                        break
-
-                if preprocessor_key:
-                    X_transformed = model.named_steps[preprocessor_key].transform(X)
-                else:
-                    X_transformed = X
-            else:
-                X_transformed = X
-
-            # Now use the final estimator with TreeExplainer
-            explainer = shap.TreeExplainer(final_estimator)
-            shap_values = explainer.shap_values(X_transformed)
-
-            # Get feature names
-            feature_names = X.columns.tolist()
-
-            # Prepare feature importance dictionary
-            feature_importance = {}
-
-            # Convert shap_values to numpy array if it's a list
-            if isinstance(shap_values, list):
-                shap_values = np.array(shap_values)
-            
-            # For binary classification, use the second class if available
-            if len(shap_values.shape) > 2:
-                shap_values = shap_values[1]
-            elif len(shap_values.shape) == 2 and shap_values.shape[0] > 1:
-                # If we have multiple classes, use the second class (index 1)
-                shap_values = shap_values[1]
-
-            # Calculate absolute mean SHAP values for feature importance
-            mean_shap_values = np.abs(shap_values[0])
-
-            for name, value in zip(feature_names, mean_shap_values):
-                feature_importance[name] = float(value)
-
-            # Sort features by importance
-            sorted_features = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)
-
-            return dict(sorted_features)
 
-        except Exception as e:
-            st.error(f"Detailed Error in SHAP explanation: {e}")
-            import traceback
-            st.error(traceback.format_exc())
-            logging.error(f"SHAP explanation error: {e}\n{traceback.format_exc()}")
-            return {}
+# CIBIL score cut-offs and the loan grade for each band (below 580 -> 'G', 800+ -> 'A')
+_CIBIL_BINS = np.array([580, 670, 740, 800])
+_GRADES = np.array(['G', 'F', 'D', 'B', 'A'])
 
-    def generate_initial_insights(self, prediction, user_data, feature_importance):
-        # Format property value and LTV ratio based on home ownership
-        property_value_text = "N/A" if user_data.get(
-            'person_home_ownership') == "RENT" else f"₹{user_data.get('property_value_inr', 'N/A'):,}"
-        ltv_ratio_text = "N/A" if user_data.get(
-            'person_home_ownership') == "RENT" else f"{user_data.get('ltv_ratio', 'N/A'):.2f}%"
+# Below this many rows a single SHAP call beats fanning out to a thread pool
+_MIN_PARALLEL_SHAP_ROWS = 64
 
-        # Enhanced system prompt with different approaches for approved vs rejected applications
-        if prediction == 0:  # Likely to be approved
-            system_prompt = f"""You are a senior loan consultant with 20 years of experience helping borrowers optimize their loan applications.
+# Prompt templates for generate_initial_insights; built once at import and filled with str.format_map
+_APPROVED_SYSTEM_PROMPT = """You are a senior loan consultant with 20 years of experience helping borrowers optimize their loan applications.
             Your job is to provide CONGRATULATORY FEEDBACK and MAINTENANCE ADVICE to the borrower.
 
             CRITICAL: The AI model predicts this application is LIKELY TO BE APPROVED. Focus on:
@@ -133,8 +48,8 @@ class LoanInsightsGenerator:
             5. Focus on the positive SHAP factors that are helping their application
             6. Provide advice for maintaining good financial habits
             """
-        else:  # At risk of rejection
-            system_prompt = f"""You are a senior loan consultant with 20 years of experience helping borrowers optimize their loan applications.
+
+_REJECTED_SYSTEM_PROMPT = """You are a senior loan consultant with 20 years of experience helping borrowers optimize their loan applications.
             Your job is to provide CONSTRUCTIVE FEEDBACK and IMPROVEMENT ADVICE to the borrower.
 
             CRITICAL: The AI model predicts this application is AT RISK OF REJECTION. Focus on:
@@ -153,49 +68,21 @@ class LoanInsightsGenerator:
             6. Emphasize that many applications can be improved with the right approach
             """
 
-        # Format SHAP feature importance for better understanding
-        top_features = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)[:5]
-        feature_analysis = "\n".join([f"- {feature}: {importance:.4f} (High Impact)" for feature, importance in top_features])
-        
-        # Calculate loan-to-income ratio for better analysis
-        loan_to_income_ratio = (user_data.get('original_loan_amnt_inr', 0) / user_data.get('original_income_inr', 1)) * 100 if user_data.get('original_income_inr', 0) > 0 else 0
-        
-        # Interest rate context
-        interest_rate = user_data.get('loan_int_rate', 0)
-        interest_rate_note = ''
-        if interest_rate == 0:
-            interest_rate_note = '(Note: This rate seems unrealistic for personal loans)'
-        elif interest_rate < 8:
-            interest_rate_note = '(Note: This is unusually low for unsecured loans in India. Typical rates are 8-25%.)'
-        
-        # LTI interpretation
-        if loan_to_income_ratio < 30:
-            lti_comment = f"Your requested loan amount of ₹{user_data.get('original_loan_amnt_inr', 0):,} is only {loan_to_income_ratio:.1f}% of your annual income, which is favorable and well within most lenders' comfort zone (typically up to 30-40%)."
-        else:
-            lti_comment = f"Your loan-to-income (LTI) ratio is {loan_to_income_ratio:.1f}%. Most lenders prefer this below 30-40%. Consider reducing your loan amount or increasing your income."
-        
-        # Home improvement while renting
-        home_improvement_note = ''
-        if user_data.get('person_home_ownership') == 'RENT' and user_data.get('loan_intent') == 'HOMEIMPROVEMENT':
-            home_improvement_note = 'Since you are renting, clarify if the improvements are for a property you own, or if you have landlord approval for the work. Lenders may ask for this.'
-        
-        # More comprehensive and borrower-focused context prompt with SHAP analysis
-        if prediction == 0:  # Likely to be approved
-            context_prompt = f"""### 🏦 Your Loan Application Details
-            - **Name:** {user_data.get('borrower_name', 'N/A')}
-            - **CIBIL Score:** {user_data.get('cibil_score', 'N/A')} (Grade: {user_data.get('loan_grade', 'N/A')})
-            - **Annual Income:** ₹{user_data.get('original_income_inr', 'N/A'):,}
-            - **Requested Loan Amount:** ₹{user_data.get('original_loan_amnt_inr', 'N/A'):,}
+_APPROVED_CONTEXT_TEMPLATE = """### 🏦 Your Loan Application Details
+            - **Name:** {borrower_name}
+            - **CIBIL Score:** {cibil_score} (Grade: {loan_grade})
+            - **Annual Income:** ₹{original_income_inr:,}
+            - **Requested Loan Amount:** ₹{original_loan_amnt_inr:,}
             - **Loan-to-Income Ratio:** {loan_to_income_ratio:.2f}% (Loan amount as % of annual income)
-            - **Loan Purpose:** {user_data.get('loan_intent', 'N/A')}
+            - **Loan Purpose:** {loan_intent}
             - **Property Value:** {property_value_text}
-            - **Total Existing Debt:** ₹{user_data.get('total_debt_inr', 'N/A'):,}
+            - **Total Existing Debt:** ₹{total_debt_inr:,}
             - **Loan-to-Value (LTV) Ratio:** {ltv_ratio_text}
-            - **Debt-to-Income (DTI) Ratio:** {user_data.get('dti_ratio', 'N/A'):.2f}%
-            - **Home Ownership Status:** {user_data.get('person_home_ownership', 'N/A')}
-            - **Age:** {user_data.get('person_age', 'N/A')}
-            - **Employment Length:** {user_data.get('person_emp_length', 'N/A')} years
-            - **Credit History Length:** {user_data.get('cb_person_cred_hist_length', 'N/A')} years
+            - **Debt-to-Income (DTI) Ratio:** {dti_ratio:.2f}%
+            - **Home Ownership Status:** {person_home_ownership}
+            - **Age:** {person_age}
+            - **Employment Length:** {person_emp_length} years
+            - **Credit History Length:** {cb_person_cred_hist_length} years
             - **Interest Rate:** {interest_rate}% {interest_rate_note}
             - **Model Prediction:** ✅ LIKELY TO BE APPROVED
 
@@ -219,22 +106,22 @@ class LoanInsightsGenerator:
             Always address the borrower directly using "you" and "your".
             **Focus on the positive SHAP factors that are working in their favor.**
             """
-        else:  # At risk of rejection
-            context_prompt = f"""### 🏦 Your Loan Application Details
-            - **Name:** {user_data.get('borrower_name', 'N/A')}
-            - **CIBIL Score:** {user_data.get('cibil_score', 'N/A')} (Grade: {user_data.get('loan_grade', 'N/A')})
-            - **Annual Income:** ₹{user_data.get('original_income_inr', 'N/A'):,}
-            - **Requested Loan Amount:** ₹{user_data.get('original_loan_amnt_inr', 'N/A'):,}
+
+_REJECTED_CONTEXT_TEMPLATE = """### 🏦 Your Loan Application Details
+            - **Name:** {borrower_name}
+            - **CIBIL Score:** {cibil_score} (Grade: {loan_grade})
+            - **Annual Income:** ₹{original_income_inr:,}
+            - **Requested Loan Amount:** ₹{original_loan_amnt_inr:,}
             - **Loan-to-Income Ratio:** {loan_to_income_ratio:.2f}% (Loan amount as % of annual income)
-            - **Loan Purpose:** {user_data.get('loan_intent', 'N/A')}
+            - **Loan Purpose:** {loan_intent}
             - **Property Value:** {property_value_text}
-            - **Total Existing Debt:** ₹{user_data.get('total_debt_inr', 'N/A'):,}
+            - **Total Existing Debt:** ₹{total_debt_inr:,}
             - **Loan-to-Value (LTV) Ratio:** {ltv_ratio_text}
-            - **Debt-to-Income (DTI) Ratio:** {user_data.get('dti_ratio', 'N/A'):.2f}%
-            - **Home Ownership Status:** {user_data.get('person_home_ownership', 'N/A')}
-            - **Age:** {user_data.get('person_age', 'N/A')}
-            - **Employment Length:** {user_data.get('person_emp_length', 'N/A')} years
-            - **Credit History Length:** {user_data.get('cb_person_cred_hist_length', 'N/A')} years
+            - **Debt-to-Income (DTI) Ratio:** {dti_ratio:.2f}%
+            - **Home Ownership Status:** {person_home_ownership}
+            - **Age:** {person_age}
+            - **Employment Length:** {person_emp_length} years
+            - **Credit History Length:** {cb_person_cred_hist_length} years
             - **Interest Rate:** {interest_rate}% {interest_rate_note}
             - **Model Prediction:** ⚠️ AT RISK OF REJECTION
 
@@ -259,6 +146,273 @@ class LoanInsightsGenerator:
             **Pay special attention to the SHAP feature importance analysis above when providing recommendations.**
             """
 
+_SIMPLIFIED_INSIGHTS_TEMPLATE = """As a loan consultant, provide advice to a borrower with:
+                    - CIBIL Score: {cibil_score}
+                    - Annual Income: ₹{original_income_inr:,}
+                    - Loan Amount: ₹{original_loan_amnt_inr:,}
+                    - Purpose: {loan_intent}
+                    - Debt-to-Income: {dti_ratio:.2f}%
+
+                    How can they improve their application?"""
+
+# Canned responses for when every Groq call fails
+_FALLBACK_INSIGHTS = """
+Loan Application Analysis
+
+Thank you for submitting your loan application. Based on the information provided, here are some general recommendations:
+
+## Key Factors to Consider
+
+- **Your credit score** is one of the most important factors in loan approval
+- **Debt-to-income ratio** significantly impacts your borrowing capacity
+- **Loan purpose** can affect risk assessment and interest rates
+- **Employment history** demonstrates stability to lenders
+
+## Recommendations
+
+1. Consider paying down existing debt before applying
+2. Check your credit report for errors that might be affecting your score
+3. Maintain consistent employment history
+4. Save for a larger down payment if possible
+
+Please use the chat feature below to ask specific questions about your application.
+"""
+
+_FALLBACK_CHAT_TEMPLATE = """I apologize, but I'm currently having trouble accessing the loan advisory system. 
+
+Here's a general response to your question about "{user_query}":
+
+When applying for loans, it's important to maintain a good credit score, keep your debt-to-income ratio low, and have stable employment history. Consider speaking with a financial advisor for personalized advice on your specific situation.
+
+Please try asking your question again in a moment."""
+
+# Keep-alive session for the exchange-rate API so cache misses reuse the TLS connection
+_http_session = requests.Session()
+_http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+# Setup basic logging
+# logging.basicConfig(filename='app.log', level=logging.ERROR, format='%(asctime)s %(levelname)s:%(message)s')
+
+
+@st.cache_resource(show_spinner=False)
+def _get_tree_explainer(estimator_key, _estimator, algorithm="v1"):
+    """Build the SHAP explainer once per estimator so reruns reuse it.
+
+    Uses Fast TreeSHAP when installed: v1 for single rows, v2 for batches
+    (v2 precomputes per-tree tensors, which only pays off over many rows).
+    tree_path_dependent works from the cover statistics stored in the trees, so no
+    background dataset is needed. TreeSHAP is exact for this mode, which is why callers
+    skip the additivity check (an extra predict pass per explain).
+    """
+    if fasttreeshap is not None:
+        return fasttreeshap.TreeExplainer(
+            _estimator,
+            feature_perturbation="tree_path_dependent",
+            algorithm=algorithm,
+            n_jobs=-1,
+            shortcut=False
+        )
+    return shap.TreeExplainer(_estimator, feature_perturbation="tree_path_dependent")
+
+
+def _pipeline_parts(model):
+    """
+    Find (preprocessor, classifier) in a pipeline with a single walk over its steps.
+    The result is memoized on the model, which st.cache_resource keeps alive for the process.
+    """
+    parts = getattr(model, '__finsage_parts__', None)
+    if parts is None:
+        preprocessor = classifier = None
+        for step in model.named_steps.values():
+            if preprocessor is None and hasattr(step, 'transform'):
+                preprocessor = step
+            if classifier is None and hasattr(step, 'predict_proba'):
+                classifier = step
+        parts = (preprocessor, classifier)
+        model.__finsage_parts__ = parts
+    return parts
+
+
+def _positive_class(shap_values):
+    """
+    Reduce Explanation.values to the (rows, features) values for the positive class.
+    Per-class output is laid out as (rows, features, classes), so this is a view, not a copy.
+    """
+    return shap_values[..., 1] if shap_values.ndim == 3 else shap_values
+
+
+def _rank_features(shap_values, feature_names):
+    """Mean absolute SHAP value per feature, ordered from most to least important"""
+    shap_values = _positive_class(shap_values)
+    mean_shap = np.abs(shap_values).mean(axis=0).astype(np.float64)[:len(feature_names)]
+
+    # Sort features by importance
+    order = np.argsort(-mean_shap, kind="stable")
+    return {feature_names[i]: float(mean_shap[i]) for i in order}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_groq_client(api_key):
+    """Share one Groq client per API key so its HTTP connections stay warm"""
+    http_client = httpx.Client(timeout=30, limits=httpx.Limits(max_keepalive_connections=8))
+    return Groq(api_key=api_key, http_client=http_client)
+
+
+class LoanInsightsGenerator:
+    def __init__(self):
+        # Debug: Check if API key is loaded
+        if not GROQ_API_KEY:
+            pass  # Could raise an error or warning if desired
+        try:
+            self.client = _get_groq_client(GROQ_API_KEY)
+        except Exception as e:
+            pass  # Could raise/log error if desired
+
+    def _explainer_inputs(self, model, X, X_transformed=None):
+        """
+        Return (final_estimator, X_transformed) for SHAP, or (None, None) on failure.
+        Pass X_transformed when the caller already ran the preprocessor to skip re-transforming.
+        """
+        # Extensive error checking
+        if model is None:
+            st.error("Model is None. Cannot generate SHAP insights.")
+            return None, None
+
+        if X is None or len(X) == 0:
+            st.error("Input data is empty or None. Cannot generate SHAP insights.")
+            return None, None
+
+        # Extract the final estimator and preprocessor from the pipeline
+        if hasattr(model, 'named_steps'):
+            preprocessor, final_estimator = _pipeline_parts(model)
+
+            if final_estimator is None:
+                st.error("No classifier found in the pipeline")
+                return None, None
+        else:
+            preprocessor, final_estimator = None, model
+
+        # Ensure transformed features for SHAP
+        if X_transformed is None:
+            X_transformed = preprocessor.transform(X) if preprocessor is not None else X
+
+        return final_estimator, X_transformed
+
+    def generate_shap_insights(self, model, X, X_transformed=None):
+        try:
+            final_estimator, X_transformed = self._explainer_inputs(model, X, X_transformed)
+            if final_estimator is None:
+                return {}
+
+            if len(X) == 1 and isinstance(final_estimator, lgb.LGBMClassifier) and final_estimator.n_classes_ == 2:
+                # Single-row fast path: LightGBM computes TreeSHAP contributions natively.
+                # The last column is the expected value, not a feature.
+                shap_values = final_estimator.booster_.predict(X_transformed, pred_contrib=True)[:, :-1]
+            else:
+                # Now use the final estimator with TreeExplainer (cached per estimator)
+                algorithm = "v1" if len(X) == 1 else "v2"
+                explainer = _get_tree_explainer(id(final_estimator), final_estimator, algorithm)
+                shap_values = explainer(X_transformed, check_additivity=False).values
+
+            return _rank_features(shap_values, X.columns.tolist())
+
+        except Exception as e:
+            st.error(f"Detailed Error in SHAP explanation: {e}")
+            st.error(traceback.format_exc())
+            logging.error(f"SHAP explanation error: {e}\n{traceback.format_exc()}")
+            return {}
+
+    def generate_shap_insights_batch(self, model, X_batch, n_jobs=-1):
+        """
+        Feature importance (mean |SHAP|) over a batch of applications.
+        With stock shap the rows are explained in chunks on a thread pool, since the
+        C tree walk releases the GIL; Fast TreeSHAP already parallelizes per sample.
+        """
+        if X_batch is None or len(X_batch) < _MIN_PARALLEL_SHAP_ROWS:
+            return self.generate_shap_insights(model, X_batch)
+
+        try:
+            final_estimator, X_transformed = self._explainer_inputs(model, X_batch)
+            if final_estimator is None:
+                return {}
+
+            explainer = _get_tree_explainer(id(final_estimator), final_estimator, "v2")
+            if fasttreeshap is not None:
+                shap_values = explainer(X_transformed, check_additivity=False).values
+            else:
+                n_chunks = min(joblib.cpu_count() if n_jobs == -1 else n_jobs, len(X_batch))
+                chunks = np.array_split(np.arange(len(X_batch)), n_chunks)
+                rows = X_transformed.iloc if hasattr(X_transformed, 'iloc') else X_transformed
+                parts = joblib.Parallel(n_jobs=n_chunks, prefer="threads")(
+                    joblib.delayed(explainer)(rows[idx], check_additivity=False) for idx in chunks
+                )
+                shap_values = np.concatenate([_positive_class(part.values) for part in parts], axis=0)
+
+            return _rank_features(shap_values, X_batch.columns.tolist())
+
+        except Exception as e:
+            st.error(f"Detailed Error in batch SHAP explanation: {e}")
+            logging.error(f"Batch SHAP explanation error: {e}\n{traceback.format_exc()}")
+            return {}
+
+    def generate_initial_insights(self, prediction, user_data, feature_importance):
+        # Format property value and LTV ratio based on home ownership
+        property_value_text = "N/A" if user_data.get(
+            'person_home_ownership') == "RENT" else f"₹{user_data.get('property_value_inr', 'N/A'):,}"
+        ltv_ratio_text = "N/A" if user_data.get(
+            'person_home_ownership') == "RENT" else f"{user_data.get('ltv_ratio', 'N/A'):.2f}%"
+
+        # Enhanced system prompt with different approaches for approved vs rejected applications
+        if prediction == 0:  # Likely to be approved
+            system_prompt = _APPROVED_SYSTEM_PROMPT
+        else:  # At risk of rejection
+            system_prompt = _REJECTED_SYSTEM_PROMPT
+
+        # Format SHAP feature importance for better understanding
+        top_features = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)[:5]
+        feature_analysis = "\n".join([f"- {feature}: {importance:.4f} (High Impact)" for feature, importance in top_features])
+        
+        # Calculate loan-to-income ratio for better analysis
+        loan_to_income_ratio = (user_data.get('original_loan_amnt_inr', 0) / user_data.get('original_income_inr', 1)) * 100 if user_data.get('original_income_inr', 0) > 0 else 0
+        
+        # Interest rate context
+        interest_rate = user_data.get('loan_int_rate', 0)
+        interest_rate_note = ''
+        if interest_rate == 0:
+            interest_rate_note = '(Note: This rate seems unrealistic for personal loans)'
+        elif interest_rate < 8:
+            interest_rate_note = '(Note: This is unusually low for unsecured loans in India. Typical rates are 8-25%.)'
+        
+        # LTI interpretation
+        if loan_to_income_ratio < 30:
+            lti_comment = f"Your requested loan amount of ₹{user_data.get('original_loan_amnt_inr', 0):,} is only {loan_to_income_ratio:.1f}% of your annual income, which is favorable and well within most lenders' comfort zone (typically up to 30-40%)."
+        else:
+            lti_comment = f"Your loan-to-income (LTI) ratio is {loan_to_income_ratio:.1f}%. Most lenders prefer this below 30-40%. Consider reducing your loan amount or increasing your income."
+        
+        # Home improvement while renting
+        home_improvement_note = ''
+        if user_data.get('person_home_ownership') == 'RENT' and user_data.get('loan_intent') == 'HOMEIMPROVEMENT':
+            home_improvement_note = 'Since you are renting, clarify if the improvements are for a property you own, or if you have landlord approval for the work. Lenders may ask for this.'
+        
+        # Values for the prompt templates; fields missing from user_data render as 'N/A'
+        prompt_values = defaultdict(lambda: 'N/A', user_data)
+        prompt_values.update(
+            property_value_text=property_value_text,
+            ltv_ratio_text=ltv_ratio_text,
+            loan_to_income_ratio=loan_to_income_ratio,
+            interest_rate=interest_rate,
+            interest_rate_note=interest_rate_note,
+            feature_analysis=feature_analysis,
+            lti_comment=lti_comment,
+            home_improvement_note=home_improvement_note
+        )
+
+        # More comprehensive and borrower-focused context prompt with SHAP analysis
+        if prediction == 0:  # Likely to be approved
+            context_prompt = _APPROVED_CONTEXT_TEMPLATE.format_map(prompt_values)
+        else:  # At risk of rejection
+            context_prompt = _REJECTED_CONTEXT_TEMPLATE.format_map(prompt_values)
+
         try:
             # Using a try-except with fallback options to ensure we always get a response
             try:
@@ -275,14 +429,7 @@ class LoanInsightsGenerator:
             except Exception as e:
                 # First fallback - try with simpler prompt
                 try:
-                    simplified_prompt = f"""As a loan consultant, provide advice to a borrower with:
-                    - CIBIL Score: {user_data.get('cibil_score', 'N/A')}
-                    - Annual Income: ₹{user_data.get('original_income_inr', 'N/A'):,}
-                    - Loan Amount: ₹{user_data.get('original_loan_amnt_inr', 'N/A'):,}
-                    - Purpose: {user_data.get('loan_intent', 'N/A')}
-                    - Debt-to-Income: {user_data.get('dti_ratio', 'N/A'):.2f}%
-
-                    How can they improve their application?"""
+                    simplified_prompt = _SIMPLIFIED_INSIGHTS_TEMPLATE.format_map(prompt_values)
 
                     response = self.client.chat.completions.create(
                         model="llama3-8b-8192",
@@ -295,27 +442,7 @@ class LoanInsightsGenerator:
                     return response.choices[0].message.content
                 except:
                     # Final fallback - hardcoded response
-                    return """
-Loan Application Analysis
-
-Thank you for submitting your loan application. Based on the information provided, here are some general recommendations:
-
-## Key Factors to Consider
-
-- **Your credit score** is one of the most important factors in loan approval
-- **Debt-to-income ratio** significantly impacts your borrowing capacity
-- **Loan purpose** can affect risk assessment and interest rates
-- **Employment history** demonstrates stability to lenders
-
-## Recommendations
-
-1. Consider paying down existing debt before applying
-2. Check your credit report for errors that might be affecting your score
-3. Maintain consistent employment history
-4. Save for a larger down payment if possible
-
-Please use the chat feature below to ask specific questions about your application.
-"""
+                    return _FALLBACK_INSIGHTS
         except Exception as e:
             return f"Error generating insights: {str(e)}"
 
@@ -400,22 +527,26 @@ Provide detailed, personalized advice based on their specific application data a
                     fallback_error = f"Fallback API call also failed: {str(e)}"
                     
                     # Final fallback for complete API failure
-                    return f"""I apologize, but I'm currently having trouble accessing the loan advisory system. 
-
-Here's a general response to your question about "{user_query}":
-
-When applying for loans, it's important to maintain a good credit score, keep your debt-to-income ratio low, and have stable employment history. Consider speaking with a financial advisor for personalized advice on your specific situation.
-
-Please try asking your question again in a moment."""
+                    return _FALLBACK_CHAT_TEMPLATE.format(user_query=user_query)
         except Exception as e:
             return f"Error generating response: {str(e)}"
 
 
+@st.cache_resource(show_spinner=False)
+def _load_model_cached(model_path):
+    """
+    Load the trained pipeline once per process.
+    Files written with joblib.dump(..., compress=0) are memory-mapped read-only,
+    so the tree arrays are shared instead of copied onto the heap; plain pickles
+    still load normally. Errors propagate so a failed load is never cached.
+    """
+    return joblib.load(model_path, mmap_mode="r")
+
+
 def load_model(model_path):
+    """Return the cached pipeline, or None (with an error shown) if it can't be loaded"""
     try:
-        with open(model_path, "rb") as file:
-            model = pickle.load(file)
-        return model
+        return _load_model_cached(model_path)
     except FileNotFoundError:
         st.error("❌ Model file not found. Please ensure 'pipeline_1.pkl' is in the correct directory.")
         logging.error(f"Model file not found: {model_path}")
@@ -430,14 +561,25 @@ def load_model(model_path):
         return None
 
 
+def predict_with_transform(model, X):
+    """
+    Predict the first row of X and return (prediction, X_transformed).
+    The preprocessed matrix is handed back so SHAP can reuse it instead of transforming again.
+    """
+    if hasattr(model, 'named_steps'):
+        X_transformed = model[:-1].transform(X)
+        return model[-1].predict(X_transformed)[0], X_transformed
+    return model.predict(X)[0], X
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
 def get_exchange_rate():
     """
-    Fetch current INR to USD exchange rate.
+    Fetch current INR to USD exchange rate (cached for an hour).
     Fallback to a recent approximate rate if API fails.
     """
-    import requests
     try:
-        response = requests.get("https://api.exchangerate-api.com/v4/latest/INR", timeout=5)
+        response = _http_session.get("https://api.exchangerate-api.com/v4/latest/INR", timeout=5)
         response.raise_for_status()
         return response.json()['rates']['USD']
     except requests.RequestException as e:
@@ -450,16 +592,9 @@ def get_exchange_rate():
         return 0.012
 
 def calculate_loan_grade(cibil_score):
-    if cibil_score < 580:
-        return 'G'
-    elif cibil_score < 670:
-        return 'F'
-    elif cibil_score < 740:
-        return 'D'
-    elif cibil_score < 800:
-        return 'B'
-    else:
-        return 'A'
+    """Map a CIBIL score (or an array of scores) to its loan grade"""
+    grades = _GRADES[np.searchsorted(_CIBIL_BINS, cibil_score, side='right')]
+    return grades if isinstance(grades, np.ndarray) else str(grades)
 
 def calculate_ltv_ratio(loan_amount, property_value, home_ownership):
     if home_ownership == "RENT":
@@ -473,6 +608,35 @@ def calculate_dti_ratio(total_debt, annual_income):
         return 0
     return (total_debt / annual_income) * 100
 
+def calculate_ltv_ratios(loan_amounts, property_values, home_ownership):
+    """Vectorized calculate_ltv_ratio over arrays of applicants"""
+    loan_amounts = np.asarray(loan_amounts, dtype=np.float64)
+    property_values = np.asarray(property_values, dtype=np.float64)
+    applies = (np.asarray(home_ownership) != "RENT") & (property_values > 0)
+    ratios = np.zeros(np.broadcast(loan_amounts, property_values, applies).shape)
+    np.divide(loan_amounts, property_values, out=ratios, where=applies)
+    return ratios * 100
+
+def calculate_dti_ratios(total_debts, annual_incomes):
+    """Vectorized calculate_dti_ratio over arrays of applicants"""
+    total_debts = np.asarray(total_debts, dtype=np.float64)
+    annual_incomes = np.asarray(annual_incomes, dtype=np.float64)
+    ratios = np.zeros(np.broadcast(total_debts, annual_incomes).shape)
+    np.divide(total_debts, annual_incomes, out=ratios, where=annual_incomes > 0)
+    return ratios * 100
+
+def _convert_amounts_and_ratios(loan_amnt_inr, property_value_inr, person_income_inr, total_debt_inr,
+                                exchange_rate, is_rent):
+    """Convert the INR amounts to USD and compute LTV/DTI in a single pass"""
+    return (
+        round(loan_amnt_inr * exchange_rate, 2),
+        round(property_value_inr * exchange_rate, 2),
+        round(person_income_inr * exchange_rate, 2),
+        round(total_debt_inr * exchange_rate, 2),
+        0 if is_rent or property_value_inr <= 0 else (loan_amnt_inr / property_value_inr) * 100,
+        0 if person_income_inr <= 0 else (total_debt_inr / person_income_inr) * 100
+    )
+
 def prepare_user_data(
     person_age,
     home_ownership,
@@ -488,15 +652,13 @@ def prepare_user_data(
     cibil_score,
     total_debt_inr
 ):
-    loan_amnt = round(loan_amnt_inr * exchange_rate, 2)
-    property_value = round(property_value_inr * exchange_rate, 2)
-    person_income = round(person_income_inr * exchange_rate, 2)
-    total_debt = round(total_debt_inr * exchange_rate, 2)
+    loan_amnt, property_value, person_income, total_debt, ltv_ratio, dti_ratio = _convert_amounts_and_ratios(
+        loan_amnt_inr, property_value_inr, person_income_inr, total_debt_inr,
+        exchange_rate, home_ownership == "RENT"
+    )
     loan_grade = calculate_loan_grade(cibil_score)
     cb_person_default_on_file = "N"
-    ltv_ratio = calculate_ltv_ratio(loan_amnt_inr, property_value_inr, home_ownership)
-    dti_ratio = calculate_dti_ratio(total_debt_inr, person_income_inr)
-    user_input = pd.DataFrame([{
+    features = {
         'person_age': person_age,
         'person_income': person_income,
         'person_home_ownership': home_ownership,
@@ -513,8 +675,10 @@ def prepare_user_data(
         'cibil_score': cibil_score,
         'total_debt': total_debt,
         # Remove borrower_name as it shouldn't affect loan decisions
-    }])
-    user_data = user_input.iloc[0].to_dict()
+    }
+    # Single-row frame for the sklearn pipeline; user_data reuses the plain dict
+    user_input = pd.DataFrame.from_dict({key: [value] for key, value in features.items()})
+    user_data = dict(features)
     user_data['original_income_inr'] = person_income_inr
     user_data['original_loan_amnt_inr'] = loan_amnt_inr
     user_data['cibil_score'] = cibil_score
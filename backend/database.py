@@ -1,22 +1,51 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 import bcrypt
 
 
 class UserDatabase:
+    # Statements kept as constants so sqlite3's per-connection statement cache reuses their compiled form
+    _INSERT_USER_SQL = 'INSERT INTO users (username, password, email) VALUES (?, ?, ?)'
+    _SELECT_PASSWORD_SQL = 'SELECT password FROM users WHERE username = ?'
+    _SELECT_USER_SQL = 'SELECT 1 FROM users WHERE username = ?'
+
     def __init__(self, db_path='users.db'):
         """Initialize database connection and create users table if not exists"""
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
+        self._db_path = db_path
+        self._local = threading.local()
 
         # Create users table if not exists
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                password TEXT NOT NULL,
-                email TEXT UNIQUE
-            )
-        ''')
-        self.conn.commit()
+        with self._conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password TEXT NOT NULL,
+                    email TEXT UNIQUE
+                )
+            ''')
+
+    def _connect(self):
+        """Open a connection for the calling thread, configured for concurrent readers"""
+        conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA cache_size=-20000')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    @contextmanager
+    def _conn(self):
+        """Yield this thread's connection; commit on success, roll back on error"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
     def hash_password(self, password):
         """Hash password using bcrypt"""
@@ -30,19 +59,16 @@ class UserDatabase:
         """Register a new user"""
         try:
             hashed_password = self.hash_password(password)
-            self.cursor.execute(
-                'INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
-                (username, hashed_password, email)
-            )
-            self.conn.commit()
+            with self._conn() as conn:
+                conn.execute(self._INSERT_USER_SQL, (username, hashed_password, email))
             return True
         except sqlite3.IntegrityError:
             return False
 
     def login_user(self, username, password):
         """Authenticate user"""
-        self.cursor.execute('SELECT password FROM users WHERE username = ?', (username,))
-        result = self.cursor.fetchone()
+        with self._conn() as conn:
+            result = conn.execute(self._SELECT_PASSWORD_SQL, (username,)).fetchone()
 
         if result:
             stored_password = result[0]
@@ -51,9 +77,12 @@ class UserDatabase:
 
     def user_exists(self, username):
         """Check if user exists"""
-        self.cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        return self.cursor.fetchone() is not None
+        with self._conn() as conn:
+            return conn.execute(self._SELECT_USER_SQL, (username,)).fetchone() is not None
 
     def close(self):
-        """Close database connection"""
-        self.conn.close()
\ No newline at end of file
+        """Close this thread's database connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
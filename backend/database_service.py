@@ -1,43 +1,174 @@
+import threading
+import time
 import bcrypt
 import uuid
+from collections import OrderedDict
+import numpy as np
 from datetime import datetime, timedelta
+from sqlalchemy import select, tuple_, union_all, update
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from backend.models import User, Session as UserSession, ChatHistory, LoanAnalysis, get_db, generate_session_token
-from backend.config import SESSION_EXPIRY_HOURS
+from backend.models import User, Session as UserSession, ChatHistory, LoanAnalysis, SessionLocal, generate_session_token
+from backend.config import SESSION_EXPIRY_HOURS, SESSION_SWEEP_INTERVAL_MINUTES, SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SECONDS, BCRYPT_COST
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _convert_dict(obj):
+    return {key: _convert_numpy_types(value) for key, value in obj.items()}
+
+def _convert_list(obj):
+    return [_convert_numpy_types(item) for item in obj]
+
+def _identity(obj):
+    return obj
+
+# Converter per exact type, so the common cases cost one dict lookup instead of an isinstance chain
+_TYPE_CONVERTERS = {
+    dict: _convert_dict,
+    list: _convert_list,
+    str: _identity,
+    int: _identity,
+    float: _identity,
+    bool: _identity,
+    type(None): _identity,
+    np.int64: int,
+    np.int32: int,
+    np.float64: float,
+    np.float32: float,
+    np.ndarray: np.ndarray.tolist,
+}
+
+def _converter_for(cls):
+    """Resolve the converter for a type missing from the table (subclasses, other numpy types) and remember it"""
+    if issubclass(cls, dict):
+        converter = _convert_dict
+    elif issubclass(cls, list):
+        converter = _convert_list
+    elif issubclass(cls, np.integer):
+        converter = int
+    elif issubclass(cls, np.floating):
+        converter = float
+    elif issubclass(cls, np.ndarray):
+        converter = np.ndarray.tolist
+    else:
+        converter = _identity
+    _TYPE_CONVERTERS[cls] = converter
+    return converter
+
+def _convert_numpy_types(obj):
+    """Recursively convert numpy types to native Python types"""
+    cls = type(obj)
+    converter = _TYPE_CONVERTERS.get(cls)
+    if converter is None:
+        converter = _converter_for(cls)
+    return converter(obj)
+
+def _to_native_types(obj):
+    """Convert numpy values to native Python types, in a single C pass when orjson is installed"""
+    if orjson is not None:
+        return orjson.loads(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS))
+    return _convert_numpy_types(obj)
+
+# Well-formed bcrypt hashes are 60 characters and start with one of these version prefixes
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+class _SessionCache:
+    """Bounded LRU of validated sessions: session_token -> (valid_until, user info)"""
+    
+    def __init__(self, max_size: int):
+        self._entries = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+    
+    def get(self, session_token: str):
+        """Return the cached user info, or None when missing or past valid_until"""
+        with self._lock:
+            entry = self._entries.get(session_token)
+            if entry is None:
+                return None
+            if entry[0] <= datetime.utcnow():
+                del self._entries[session_token]
+                return None
+            self._entries.move_to_end(session_token)
+            return entry[1]
+    
+    def put(self, session_token: str, valid_until: datetime, user_info: dict):
+        """Cache user info until valid_until, evicting expired and least recently used entries"""
+        now = datetime.utcnow()
+        with self._lock:
+            self._entries[session_token] = (valid_until, user_info)
+            self._entries.move_to_end(session_token)
+            # Oldest entries first: drop expired ones, then trim to the size bound
+            while self._entries:
+                oldest_token, (oldest_until, _) = next(iter(self._entries.items()))
+                if oldest_until > now and len(self._entries) <= self._max_size:
+                    break
+                del self._entries[oldest_token]
+    
+    def pop(self, session_token: str):
+        """Forget a session, e.g. on logout"""
+        with self._lock:
+            self._entries.pop(session_token, None)
+
+# Validated sessions, so repeat checks within a page load skip the database
+_SESSION_CACHE = _SessionCache(SESSION_CACHE_SIZE)
 
 class DatabaseService:
     """Database service for PostgreSQL operations"""
     
     def __init__(self):
-        self.db = next(get_db())
+        # The scoped_session proxy resolves to the calling thread's Session on every use.
+        # Every public method closes it when done, so its connection returns to the pool
+        # even though Streamlit never tears down the script threads' sessions itself.
+        self.db = SessionLocal
     
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.db.close()
+        SessionLocal.remove()
     
     def hash_password(self, password: str) -> str:
         """Hash password using bcrypt"""
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=BCRYPT_COST)
         hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
         return hashed.decode('utf-8')
     
     def verify_password(self, stored_password: str, provided_password: str) -> bool:
         """Verify provided password against stored hash"""
+        # Reject malformed hashes before paying for a full bcrypt round
+        if not (stored_password and len(stored_password) == 60 and stored_password.startswith(_BCRYPT_PREFIXES)):
+            return False
         try:
             return bcrypt.checkpw(provided_password.encode('utf-8'), stored_password.encode('utf-8'))
         except Exception:
             return False
     
+    def password_needs_rehash(self, stored_password: str) -> bool:
+        """Check whether a stored hash was made with a different cost than BCRYPT_COST"""
+        # bcrypt hashes look like $2b$12$..., with the cost in the third field
+        try:
+            return int(stored_password.split('$')[2]) != BCRYPT_COST
+        except (IndexError, ValueError):
+            return False
+    
+    def _find_user(self, username: str, email: str):
+        """Find a user by username or email using each column's unique index"""
+        # An OR across two columns tends to become a sequential scan; UNION ALL keeps two index lookups
+        lookup = union_all(
+            select(User).where(User.username == username),
+            select(User).where(User.email == email)
+        ).limit(1)
+        return self.db.execute(select(User).from_statement(lookup)).scalars().first()
+    
     def register_user(self, username: str, email: str, password: str) -> dict:
         """Register a new user"""
         try:
             # Check if user already exists
-            existing_user = self.db.query(User).filter(
-                (User.username == username) | (User.email == email)
-            ).first()
+            existing_user = self._find_user(username, email)
             
             if existing_user:
                 return {"success": False, "message": "Username or email already exists"}
@@ -62,14 +193,14 @@ class DatabaseService:
         except Exception as e:
             self.db.rollback()
             return {"success": False, "message": f"Registration failed: {str(e)}"}
+        finally:
+            self.db.close()
     
     def login_user(self, username: str, password: str) -> dict:
         """Authenticate user and create session"""
         try:
             # Find user by username or email
-            user = self.db.query(User).filter(
-                (User.username == username) | (User.email == username)
-            ).first()
+            user = self._find_user(username, username)
             
             if not user:
                 return {"success": False, "message": "Invalid credentials"}
@@ -81,6 +212,10 @@ class DatabaseService:
             if not self.verify_password(user.password_hash, password):
                 return {"success": False, "message": "Invalid credentials"}
             
+            # Re-hash with the configured cost while we have the plaintext
+            if self.password_needs_rehash(user.password_hash):
+                user.password_hash = self.hash_password(password)
+            
             # Create session
             session_token = generate_session_token()
             expires_at = datetime.utcnow() + timedelta(hours=SESSION_EXPIRY_HOURS)
@@ -106,39 +241,59 @@ class DatabaseService:
         except Exception as e:
             self.db.rollback()
             return {"success": False, "message": f"Login failed: {str(e)}"}
+        finally:
+            self.db.close()
     
     def validate_session(self, session_token: str) -> dict:
         """Validate session token and return user info"""
+        user_info = _SESSION_CACHE.get(session_token)
+        if user_info:
+            return dict(user_info)
+        
         try:
-            session = self.db.query(UserSession).filter(
-                UserSession.session_token == session_token
+            # Check validity and slide the expiry forward in one round trip:
+            # UPDATE ... RETURNING as a CTE, joined to the owning user
+            now = datetime.utcnow()
+            refreshed = (
+                update(UserSession)
+                .where(UserSession.session_token == session_token, UserSession.expires_at > now)
+                .values(expires_at=now + timedelta(hours=SESSION_EXPIRY_HOURS))
+                .returning(UserSession.user_id, UserSession.expires_at)
+                .cte("refreshed")
+            )
+            row = self.db.execute(
+                select(User.id, User.username, User.email, User.is_active, refreshed.c.expires_at)
+                .join(refreshed, refreshed.c.user_id == User.id)
             ).first()
+            self.db.commit()
             
-            if not session:
-                return {"success": False, "message": "Invalid session"}
+            if not row:
+                # Unknown or expired; expired rows are removed by the background sweeper
+                return {"success": False, "message": "Invalid or expired session"}
             
-            if session.expires_at < datetime.utcnow():
-                # Delete expired session
-                self.db.delete(session)
-                self.db.commit()
-                return {"success": False, "message": "Session expired"}
-            
-            user = self.db.query(User).filter(User.id == session.user_id).first()
-            if not user or not user.is_active:
+            if not row.is_active:
                 return {"success": False, "message": "User not found or inactive"}
             
-            return {
+            user_info = {
                 "success": True,
-                "user_id": user.id,
-                "username": user.username,
-                "email": user.email
+                "user_id": row.id,
+                "username": row.username,
+                "email": row.email
             }
+            # Keep cache hits short-lived so the UPDATE above keeps running and sliding the expiry
+            cached_until = min(row.expires_at, now + timedelta(seconds=SESSION_CACHE_TTL_SECONDS))
+            _SESSION_CACHE.put(session_token, cached_until, user_info)
+            return dict(user_info)
             
         except Exception as e:
+            self.db.rollback()
             return {"success": False, "message": f"Session validation failed: {str(e)}"}
+        finally:
+            self.db.close()
     
     def logout_user(self, session_token: str) -> dict:
         """Logout user by deleting session"""
+        _SESSION_CACHE.pop(session_token, None)
         try:
             session = self.db.query(UserSession).filter(
                 UserSession.session_token == session_token
@@ -154,6 +309,23 @@ class DatabaseService:
         except Exception as e:
             self.db.rollback()
             return {"success": False, "message": f"Logout failed: {str(e)}"}
+        finally:
+            self.db.close()
+    
+    def purge_expired_sessions(self) -> dict:
+        """Delete all expired sessions in a single statement"""
+        try:
+            deleted = self.db.query(UserSession).filter(
+                UserSession.expires_at < datetime.utcnow()
+            ).delete(synchronize_session=False)
+            self.db.commit()
+            return {"success": True, "deleted": deleted}
+            
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": f"Failed to purge expired sessions: {str(e)}"}
+        finally:
+            self.db.close()
     
     def save_chat_message(self, user_id: int, session_id: int, role: str, content: str) -> dict:
         """Save a chat message to the database"""
@@ -174,59 +346,109 @@ class DatabaseService:
         except Exception as e:
             self.db.rollback()
             return {"success": False, "message": f"Failed to save chat message: {str(e)}"}
+        finally:
+            self.db.close()
     
-    def get_chat_history(self, user_id: int, session_id: int = None, limit: int = 50) -> dict:
-        """Get chat history for a user or session"""
+    def save_chat_messages(self, rows: list) -> dict:
+        """Save several chat messages in one transaction.
+        
+        Each row is a dict with user_id, session_id, role and content.
+        """
         try:
-            query = self.db.query(ChatHistory).filter(ChatHistory.user_id == user_id)
+            self.db.bulk_insert_mappings(ChatHistory, rows)
+            self.db.commit()
             
-            if session_id:
-                query = query.filter(ChatHistory.session_id == session_id)
+            return {"success": True, "count": len(rows)}
             
-            chat_history = query.order_by(ChatHistory.timestamp.desc()).limit(limit).all()
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": f"Failed to save chat messages: {str(e)}"}
+        finally:
+            self.db.close()
+    
+    def _chat_history_query(self, user_id: int, session_id: int = None,
+                            before_ts: datetime = None, before_id: int = None):
+        """Build the newest-first chat history query shared by the list and streaming readers"""
+        # Project just the returned columns; rows come back as tuples, not hydrated ORM objects
+        query = self.db.query(
+            ChatHistory.id, ChatHistory.role, ChatHistory.content, ChatHistory.timestamp
+        ).filter(ChatHistory.user_id == user_id)
+        
+        if session_id:
+            query = query.filter(ChatHistory.session_id == session_id)
+        
+        if before_ts is not None and before_id is not None:
+            if isinstance(before_ts, str):
+                before_ts = datetime.fromisoformat(before_ts)
+            query = query.filter(tuple_(ChatHistory.timestamp, ChatHistory.id) < (before_ts, before_id))
+        
+        return query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())
+    
+    def get_chat_history(self, user_id: int, session_id: int = None, limit: int = 50,
+                         before_ts: datetime = None, before_id: int = None) -> dict:
+        """Get chat history for a user or session, newest first.
+        
+        Pass the returned next_cursor back as before_ts/before_id to fetch the
+        page of older messages (keyset pagination on (timestamp, id)).
+        """
+        try:
+            chat_history = self._chat_history_query(
+                user_id, session_id, before_ts, before_id
+            ).limit(limit).all()
+            
+            messages = [
+                {
+                    "id": msg.id,
+                    "role": msg.role,
+                    "content": msg.content,
+                    "timestamp": msg.timestamp.isoformat()
+                }
+                for msg in chat_history
+            ]
+            next_cursor = None
+            if len(messages) == limit:
+                next_cursor = {"before_ts": messages[-1]["timestamp"], "before_id": messages[-1]["id"]}
             
             return {
                 "success": True,
-                "chat_history": [
-                    {
-                        "id": msg.id,
-                        "role": msg.role,
-                        "content": msg.content,
-                        "timestamp": msg.timestamp.isoformat()
-                    }
-                    for msg in chat_history
-                ]
+                "chat_history": messages,
+                "next_cursor": next_cursor
             }
             
         except Exception as e:
+            self.db.rollback()
             return {"success": False, "message": f"Failed to get chat history: {str(e)}"}
+        finally:
+            self.db.close()
+    
+    def iter_chat_history(self, user_id: int, session_id: int = None, limit: int = None):
+        """Yield chat messages newest first, fetching rows from the database 100 at a time"""
+        query = self._chat_history_query(user_id, session_id)
+        if limit is not None:
+            query = query.limit(limit)
+        
+        try:
+            for msg in query.yield_per(100):
+                yield {
+                    "id": msg.id,
+                    "role": msg.role,
+                    "content": msg.content,
+                    "timestamp": msg.timestamp.isoformat()
+                }
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            self.db.close()
     
     def save_loan_analysis(self, user_id: int, analysis_data: dict, prediction: int, 
                           feature_importance: dict = None, insights: str = None) -> dict:
         """Save loan analysis results"""
         try:
-            # Convert numpy types to native Python types
-            import numpy as np
-            
-            def convert_numpy_types(obj):
-                """Recursively convert numpy types to native Python types"""
-                if isinstance(obj, dict):
-                    return {key: convert_numpy_types(value) for key, value in obj.items()}
-                elif isinstance(obj, list):
-                    return [convert_numpy_types(item) for item in obj]
-                elif isinstance(obj, np.integer):
-                    return int(obj)
-                elif isinstance(obj, np.floating):
-                    return float(obj)
-                elif isinstance(obj, np.ndarray):
-                    return obj.tolist()
-                else:
-                    return obj
-            
             # Convert the data
-            converted_analysis_data = convert_numpy_types(analysis_data)
-            converted_feature_importance = convert_numpy_types(feature_importance) if feature_importance else None
-            converted_prediction = convert_numpy_types(prediction)
+            converted_analysis_data = _to_native_types(analysis_data)
+            converted_feature_importance = _to_native_types(feature_importance) if feature_importance else None
+            converted_prediction = _to_native_types(prediction)
             
             loan_analysis = LoanAnalysis(
                 user_id=user_id,
@@ -245,11 +467,20 @@ class DatabaseService:
         except Exception as e:
             self.db.rollback()
             return {"success": False, "message": f"Failed to save loan analysis: {str(e)}"}
+        finally:
+            self.db.close()
     
     def get_loan_analyses(self, user_id: int, limit: int = 10) -> dict:
         """Get loan analysis history for a user"""
         try:
-            analyses = self.db.query(LoanAnalysis).filter(
+            analyses = self.db.query(
+                LoanAnalysis.id,
+                LoanAnalysis.prediction,
+                LoanAnalysis.analysis_data,
+                LoanAnalysis.feature_importance,
+                LoanAnalysis.insights,
+                LoanAnalysis.created_at
+            ).filter(
                 LoanAnalysis.user_id == user_id
             ).order_by(LoanAnalysis.created_at.desc()).limit(limit).all()
             
@@ -269,14 +500,43 @@ class DatabaseService:
             }
             
         except Exception as e:
+            self.db.rollback()
             return {"success": False, "message": f"Failed to get loan analyses: {str(e)}"}
+        finally:
+            self.db.close()
     
     def user_exists(self, username: str) -> bool:
         """Check if user exists"""
-        user = self.db.query(User).filter(User.username == username).first()
-        return user is not None
+        try:
+            user = self.db.query(User).filter(User.username == username).first()
+            return user is not None
+        finally:
+            self.db.close()
     
     def email_exists(self, email: str) -> bool:
         """Check if email exists"""
-        user = self.db.query(User).filter(User.email == email).first()
-        return user is not None 
\ No newline at end of file
+        try:
+            user = self.db.query(User).filter(User.email == email).first()
+            return user is not None
+        finally:
+            self.db.close()
+
+
+_sweeper_thread = None
+_sweeper_lock = threading.Lock()
+
+def start_session_sweeper(interval_minutes: int = SESSION_SWEEP_INTERVAL_MINUTES):
+    """Start the background thread that purges expired sessions (at most once per process)"""
+    global _sweeper_thread
+    with _sweeper_lock:
+        if _sweeper_thread is not None:
+            return
+        
+        def sweep():
+            while True:
+                time.sleep(interval_minutes * 60)
+                with DatabaseService() as service:
+                    service.purge_expired_sessions()
+        
+        _sweeper_thread = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+        _sweeper_thread.start()
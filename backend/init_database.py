@@ -10,6 +10,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from backend.models import create_tables, engine
 from backend.config import DATABASE_URL
 import psycopg2
+from psycopg2 import sql
 from sqlalchemy.exc import OperationalError
 
 def test_connection():
@@ -41,7 +42,7 @@ def create_database():
         exists = cursor.fetchone()
         
         if not exists:
-            cursor.execute(f"CREATE DATABASE {db_name}")
+            cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name)))
             print(f"✅ Database '{db_name}' created successfully")
         else:
             print(f"✅ Database '{db_name}' already exists")
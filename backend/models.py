@@ -1,11 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
 from sqlalchemy.sql import func
-import uuid
+import secrets
 import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from backend.config import DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_RECYCLE, DATABASE_QUERY_CACHE_SIZE
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Load environment variables
 load_dotenv()
@@ -36,9 +43,16 @@ class User(Base):
 class Session(Base):
     """Session model for user session management"""
     __tablename__ = 'sessions'
+    __table_args__ = (
+        # PostgreSQL doesn't index foreign keys itself; needed for per-user lookups and cascade deletes
+        Index("ix_sessions_user", "user_id"),
+        # Range scans for the background expiry sweep
+        Index("ix_sessions_expires", "expires_at"),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # The UNIQUE constraint's own B-tree serves token lookups; no separate index needed
     session_token = Column(String(255), unique=True, nullable=False)
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=func.now())
@@ -49,6 +63,8 @@ class Session(Base):
 class ChatHistory(Base):
     """Chat history model for storing conversation messages"""
     __tablename__ = 'chat_history'
+    # Serves "latest messages for a user" (ORDER BY timestamp DESC LIMIT n) straight from the index
+    __table_args__ = (Index("ix_chat_user_ts", "user_id", "timestamp"),)
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -64,21 +80,48 @@ class ChatHistory(Base):
 class LoanAnalysis(Base):
     """Loan analysis model for storing analysis results"""
     __tablename__ = 'loan_analyses'
+    # Serves "latest analyses for a user" (ORDER BY created_at DESC LIMIT n) straight from the index
+    __table_args__ = (
+        Index("ix_loan_user_created", "user_id", "created_at"),
+        # GIN index for containment queries on the stored application data
+        Index("ix_loan_analysis_data_gin", "analysis_data",
+              postgresql_using="gin", postgresql_ops={"analysis_data": "jsonb_path_ops"}),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    analysis_data = Column(JSON, nullable=False)  # Store user input data
+    analysis_data = Column(JSONB, nullable=False)  # Store user input data
     prediction = Column(Integer, nullable=False)  # 0 for approved, 1 for rejected
-    feature_importance = Column(JSON, nullable=True)  # Store SHAP feature importance
+    feature_importance = Column(JSONB, nullable=True)  # Store SHAP feature importance
     insights = Column(Text, nullable=True)  # Store AI-generated insights
     created_at = Column(DateTime, default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="loan_analyses")
 
+# JSON/JSONB columns use orjson on write and read; the psycopg2 dialect registers the
+# deserializer on this engine's connections only
+if orjson is not None:
+    _engine_json_options = {
+        "json_serializer": lambda obj: orjson.dumps(obj).decode(),
+        "json_deserializer": orjson.loads
+    }
+else:
+    _engine_json_options = {}
+
 # Database engine and session factory
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=DATABASE_POOL_SIZE,
+    max_overflow=DATABASE_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=DATABASE_POOL_RECYCLE,
+    # Compiled-SQL cache shared by all sessions; sized so the hot auth/chat statements never get evicted
+    query_cache_size=DATABASE_QUERY_CACHE_SIZE,
+    **_engine_json_options
+)
+# Thread-local sessions: each Streamlit script thread gets its own Session backed by the shared pool
+SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
 def get_db():
     """Get database session"""
@@ -86,15 +129,15 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
+        SessionLocal.remove()
 
 def create_tables():
     """Create all database tables"""
     Base.metadata.create_all(bind=engine)
 
 def generate_session_token():
-    """Generate a unique session token"""
-    return str(uuid.uuid4())
+    """Generate a unique session token (256 bits, URL-safe)"""
+    return secrets.token_urlsafe(32)
 
 def is_session_expired(expires_at):
     """Check if session is expired"""
@@ -8,11 +8,13 @@ if project_root not in sys.path:
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
+import traceback
+from itertools import islice
 import requests
-from backend.backend import load_model, LoanInsightsGenerator, prepare_user_data, get_exchange_rate
-from backend.database_service import DatabaseService
-from frontend.chatbot import initialize_chat_session, display_chat_history, handle_chat_interaction, start_new_chat
+from backend.backend import load_model, LoanInsightsGenerator, prepare_user_data, get_exchange_rate, predict_with_transform
+from frontend.chatbot import initialize_chat_session, display_chat_history, handle_chat_interaction, start_new_chat, get_db_service
 from dotenv import load_dotenv
 from backend.config import GROQ_API_KEY
 
@@ -22,9 +24,14 @@ from backend.config import GROQ_API_KEY
 # Load environment variables from .env file
 load_dotenv()
 
-# Load the trained model pipeline
+# Trained model pipeline; loaded lazily in main() through the cached load_model
 MODEL_PATH = r"backend/pipeline_1.pkl"  # Update this path as needed
-model = load_model(MODEL_PATH)
+
+# Prediction verdicts, shown with native st.success / st.error instead of custom HTML
+_APPROVED_TEXT = "🎉 **LIKELY TO BE APPROVED**"
+_REJECTED_TEXT = "⚠️ **AT RISK OF REJECTION**"
+_APPROVED_DETAIL = "Your loan application shows strong indicators for approval!"
+_REJECTED_DETAIL = "Your application may need improvements to increase approval chances."
 
 
 def logout():
@@ -33,7 +40,7 @@ def logout():
     session_token = st.session_state.get('session_token')
     if session_token:
         try:
-            db_service = DatabaseService()
+            db_service = get_db_service()
             db_service.logout_user(session_token)
         except Exception as e:
             st.error(f"Logout error: {e}")
@@ -48,6 +55,32 @@ def logout():
     st.session_state.current_session_id = None
     st.rerun()
 
+def _show_verdict(prediction, detailed=False):
+    """Show the approval verdict, with the explanatory sentence when detailed"""
+    if prediction == 0:
+        st.success(f"{_APPROVED_TEXT}\n\n{_APPROVED_DETAIL}" if detailed else _APPROVED_TEXT)
+    else:
+        st.error(f"{_REJECTED_TEXT}\n\n{_REJECTED_DETAIL}" if detailed else _REJECTED_TEXT)
+
+@st.cache_data(max_entries=64, ttl=600, show_spinner=False)
+def _cached_prepare_user_data(*args):
+    """prepare_user_data memoized on the form inputs, so reruns with unchanged inputs skip it"""
+    return prepare_user_data(*args)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_analyses(user_id, limit):
+    """Recent loan analyses for a user, reused across reruns for a minute"""
+    return get_db_service().get_loan_analyses(user_id, limit=limit)
+
+def _top_features(feature_importance, k):
+    """Return the k highest-importance (feature, importance) pairs, largest first"""
+    names = np.array(list(feature_importance.keys()))
+    values = np.fromiter(feature_importance.values(), dtype=np.float64, count=len(feature_importance))
+    # Partial selection of the top k, then order just those k
+    idx = np.argpartition(-values, k - 1)[:k] if len(values) > k else np.arange(len(values))
+    idx = idx[np.argsort(-values[idx], kind='stable')]
+    return zip(names[idx], values[idx])
+
 def display_analysis_history():
     """Display user's loan analysis history"""
     st.title("📊 Your Loan Analysis History")
@@ -58,8 +91,7 @@ def display_analysis_history():
         return
     
     try:
-        db_service = DatabaseService()
-        result = db_service.get_loan_analyses(user_id, limit=10)
+        result = _cached_analyses(user_id, 10)
         
         if result["success"] and result["analyses"]:
             st.write(f"Found {len(result['analyses'])} previous analyses:")
@@ -68,41 +100,32 @@ def display_analysis_history():
                 with st.expander(f"Analysis #{analysis['id']} - {analysis['created_at'][:10]}", expanded=False):
                     col1, col2 = st.columns(2)
                     
+                    # One markdown element per block instead of one per line
                     with col1:
-                        st.write("**Prediction:**")
-                        if analysis['prediction'] == 0:
-                            st.markdown("""
-                            <div style="background-color: #d4edda; border: 1px solid #28a745; border-radius: 5px; padding: 10px; text-align: center;">
-                                <strong style="color: #155724;">🎉 LIKELY TO BE APPROVED</strong>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        else:
-                            st.markdown("""
-                            <div style="background-color: #f8d7da; border: 1px solid #dc3545; border-radius: 5px; padding: 10px; text-align: center;">
-                                <strong style="color: #721c24;">⚠️ AT RISK OF REJECTION</strong>
-                            </div>
-                            """, unsafe_allow_html=True)
+                        st.markdown("**Prediction:**")
+                        _show_verdict(analysis['prediction'])
                         
-                        st.write("**Key Data:**")
                         data = analysis['analysis_data']
-                        st.write(f"- Age: {data.get('person_age', 'N/A')}")
-                        st.write(f"- Income: ₹{data.get('original_income_inr', 'N/A'):,}")
-                        st.write(f"- Loan Amount: ₹{data.get('original_loan_amnt_inr', 'N/A'):,}")
-                        st.write(f"- CIBIL Score: {data.get('cibil_score', 'N/A')}")
+                        st.markdown(
+                            "**Key Data:**\n"
+                            f"- Age: {data.get('person_age', 'N/A')}\n"
+                            f"- Income: ₹{data.get('original_income_inr', 'N/A'):,}\n"
+                            f"- Loan Amount: ₹{data.get('original_loan_amnt_inr', 'N/A'):,}\n"
+                            f"- CIBIL Score: {data.get('cibil_score', 'N/A')}"
+                        )
                     
                     with col2:
-                        st.write("**Feature Importance:**")
                         if analysis['feature_importance']:
                             # Show top 3 features
-                            sorted_features = sorted(analysis['feature_importance'].items(), 
-                                                   key=lambda x: x[1], reverse=True)[:3]
-                            for feature, importance in sorted_features:
-                                st.write(f"- {feature}: {importance:.3f}")
+                            top_features = "\n".join(
+                                f"- {feature}: {importance:.3f}"
+                                for feature, importance in _top_features(analysis['feature_importance'], 3)
+                            )
+                            st.markdown(f"**Feature Importance:**\n{top_features}")
                         else:
-                            st.write("No feature importance data")
+                            st.markdown("**Feature Importance:**\n\nNo feature importance data")
                     
-                    st.write("**Insights:**")
-                    st.write(analysis['insights'] or "No insights available")
+                    st.markdown(f"**Insights:**\n\n{analysis['insights'] or 'No insights available'}")
         else:
             st.info("No previous analyses found. Run your first analysis to see it here!")
             
@@ -110,6 +133,107 @@ def display_analysis_history():
         st.error(f"Failed to load analysis history: {e}")
 
 
+def _build_chat_context(prediction, user_data, feature_importance, initial_insights):
+    """Build the loan analysis context passed to the chat assistant"""
+    top_factors = "\n".join(
+        f"- {feature}: {importance:.4f}" for feature, importance in islice(feature_importance.items(), 5)
+    )
+    return f"""🏦 LOAN APPLICATION ANALYSIS CONTEXT
+
+📊 PREDICTION RESULT:
+- Model Prediction: {'LIKELY TO BE APPROVED' if prediction == 0 else 'AT RISK OF REJECTION'}
+- Confidence Level: Based on ML model analysis
+
+👤 APPLICANT PROFILE:
+- Name: {user_data.get('borrower_name', 'N/A')}
+- Age: {user_data.get('person_age', 'N/A')} years
+- Annual Income: ₹{user_data.get('original_income_inr', 'N/A'):,}
+- Employment Length: {user_data.get('person_emp_length', 'N/A')} years
+- Credit History Length: {user_data.get('cb_person_cred_hist_length', 'N/A')} years
+- CIBIL Score: {user_data.get('cibil_score', 'N/A')}
+- Home Ownership: {user_data.get('person_home_ownership', 'N/A')}
+
+💰 LOAN DETAILS:
+- Requested Amount: ₹{user_data.get('original_loan_amnt_inr', 'N/A'):,}
+- Loan Purpose: {user_data.get('loan_intent', 'N/A')}
+- Interest Rate: {user_data.get('loan_int_rate', 'N/A')}%
+- Loan Grade: {user_data.get('loan_grade', 'N/A')}
+- Total Existing Debt: ₹{user_data.get('total_debt_inr', 'N/A'):,}
+
+📈 FINANCIAL RATIOS:
+- Debt-to-Income (DTI) Ratio: {user_data.get('dti_ratio', 'N/A'):.2f}%
+- Loan-to-Value (LTV) Ratio: {user_data.get('ltv_ratio', 'N/A'):.2f}% if applicable
+- Property Value: ₹{user_data.get('property_value_inr', 'N/A'):,} (if applicable)
+
+🎯 SHAP FEATURE IMPORTANCE (Top Factors):
+{top_factors}
+
+💡 INITIAL ANALYSIS INSIGHTS:
+{initial_insights}
+
+🔍 CONTEXT FOR CHAT:
+This data represents a comprehensive loan application analysis. The SHAP feature importance shows which factors most significantly impact the loan approval decision. The financial ratios provide key metrics lenders consider. Use this context to provide specific, actionable advice to the borrower."""
+
+
+def _render_results(prediction, feature_importance, user_data, initial_insights):
+    """Display the analysis results and the follow-up chat"""
+    # Show prediction result prominently
+    st.markdown("---")
+    
+    # Create a prominent prediction display
+    _show_verdict(prediction, detailed=True)
+    
+    st.markdown("---")
+    st.markdown("### 🔍 Your Personalized Loan Application Insights")
+
+    # Display feature importance as a bar chart with explanatory text
+    st.subheader("Factors Affecting Your Application")
+    st.write("These factors have the most impact on your loan approval chances:")
+    try:
+        # Build the chart frame once per analysis; later reruns reuse it
+        feat_df = st.session_state.get('feat_df')
+        if feat_df is None:
+            feat_df = pd.DataFrame.from_dict(feature_importance, orient='index', columns=['Importance'])
+            feat_df = feat_df.sort_values('Importance', ascending=False)
+            st.session_state.feat_df = feat_df
+        st.bar_chart(feat_df)
+    except Exception as e:
+        st.error(f"❌ Error displaying feature importance: {e}")
+
+    # Display initial insights with better formatting
+    st.markdown("### 📝 Personalized Recommendations")
+    st.markdown(initial_insights)
+
+    # Chat interface for follow-up questions
+    st.markdown("### 💬 Ask Questions About Your Application")
+    st.write("Have questions about your loan application? Ask our loan advisor for personalized guidance.")
+
+    # Initialize chat session
+    initialize_chat_session()
+
+    # Comprehensive context for chat, built once per analysis
+    context = st.session_state.get('chat_context')
+    if context is None:
+        context = _build_chat_context(prediction, user_data, feature_importance, initial_insights)
+        st.session_state.chat_context = context
+
+    chat_panel(context)
+
+
+@st.fragment
+def chat_panel(context):
+    """Chat history and input; sending a message reruns only this fragment, not the whole page"""
+    # Display chat history
+    display_chat_history()
+
+    # Handle chat interaction
+    try:
+        handle_chat_interaction(context)
+    except Exception as e:
+        st.error(f"❌ Error in chat interaction: {e}")
+        st.error(traceback.format_exc())
+
+
 def main():
     # Initialize session state variables if not exist
     if 'username' not in st.session_state:
@@ -117,7 +241,8 @@ def main():
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = True  # Set to True for direct access
     
-    # Exchange rate (fetch or use fallback)
+    # Both are cached across reruns (st.cache_resource / st.cache_data in the backend)
+    model = load_model(MODEL_PATH)
     exchange_rate = get_exchange_rate()
 
     # Add sidebar with user information
@@ -192,7 +317,7 @@ def main():
                                          help="Sum of all current outstanding debts")
 
     # Prepare all data using backend
-    user_input, user_data, loan_grade, ltv_ratio, dti_ratio = prepare_user_data(
+    user_input, user_data, loan_grade, ltv_ratio, dti_ratio = _cached_prepare_user_data(
         person_age,
         home_ownership,
         borrower_name,
@@ -239,50 +364,32 @@ def main():
                 if not st.session_state.analysis_done:
                     try:
                         # Make prediction
-                        prediction = model.predict(user_input)[0]
+                        prediction, X_transformed = predict_with_transform(model, user_input)
                     except Exception as e:
                         st.error(f"❌ Error during prediction: {e}")
-                        import traceback
                         st.error(traceback.format_exc())
                         return
 
-                    # Display prominent prediction result
-                    st.markdown("---")
-                    
-                    # Create a prominent prediction display
+                    # Celebrate only on the pass that produced the result
                     if prediction == 0:
                         st.balloons()
-                        st.markdown("""
-                        <div style="background-color: #d4edda; border: 2px solid #28a745; border-radius: 10px; padding: 20px; text-align: center; margin: 20px 0;">
-                            <h2 style="color: #155724; margin: 0;">🎉 LIKELY TO BE APPROVED</h2>
-                            <p style="color: #155724; font-size: 18px; margin: 10px 0;">Your loan application shows strong indicators for approval!</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown("""
-                        <div style="background-color: #f8d7da; border: 2px solid #dc3545; border-radius: 10px; padding: 20px; text-align: center; margin: 20px 0;">
-                            <h2 style="color: #721c24; margin: 0;">⚠️ AT RISK OF REJECTION</h2>
-                            <p style="color: #721c24; font-size: 18px; margin: 10px 0;">Your application may need improvements to increase approval chances.</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    st.markdown("---")
 
                     # Initialize Insights Generator
                     insights_generator = LoanInsightsGenerator()
 
                     # Generate SHAP Feature Importance
                     try:
-                        feature_importance = insights_generator.generate_shap_insights(model, user_input)
+                        feature_importance = insights_generator.generate_shap_insights(model, user_input, X_transformed)
                     except Exception as e:
                         st.error(f"❌ Error generating feature importance: {e}")
-                        import traceback
                         st.error(traceback.format_exc())
                         feature_importance = {}
 
                     # Store results in session state
                     st.session_state.prediction = prediction
                     st.session_state.feature_importance = feature_importance
+                    st.session_state.feat_df = None
+                    st.session_state.chat_context = None
                     st.session_state.user_data = user_data
 
                     # Generate and display initial insights
@@ -294,7 +401,6 @@ def main():
                         )
                     except Exception as e:
                         st.error(f"❌ Error generating initial insights: {e}")
-                        import traceback
                         st.error(traceback.format_exc())
                         initial_insights = "Error generating insights."
                     st.session_state.initial_insights = initial_insights
@@ -304,7 +410,7 @@ def main():
                     user_id = st.session_state.get('user_id')
                     if user_id:
                         try:
-                            db_service = DatabaseService()
+                            db_service = get_db_service()
                             analysis_result = db_service.save_loan_analysis(
                                 user_id=user_id,
                                 analysis_data=user_data,
@@ -314,6 +420,7 @@ def main():
                             )
                             if analysis_result["success"]:
                                 st.session_state.analysis_id = analysis_result["analysis_id"]
+                                _cached_analyses.clear()
                                 st.success("✅ Analysis saved to your account")
                             else:
                                 st.warning(f"⚠️ Could not save analysis: {analysis_result['message']}")
@@ -324,111 +431,18 @@ def main():
                     st.session_state.chat_history = []
                     st.session_state.chat_history_loaded = False
                     # Keep current_session_id to maintain chat continuity
-                    st.rerun()
-
-                # If analysis is already done, use stored results
-                prediction = st.session_state.prediction
-                feature_importance = st.session_state.feature_importance
-                user_data = st.session_state.user_data
-                initial_insights = st.session_state.initial_insights
-
-                # Display stored results
-                # Show prediction result prominently
-                st.markdown("---")
-                
-                # Create a prominent prediction display for stored results
-                if prediction == 0:
-                    st.markdown("""
-                    <div style="background-color: #d4edda; border: 2px solid #28a745; border-radius: 10px; padding: 20px; text-align: center; margin: 20px 0;">
-                        <h2 style="color: #155724; margin: 0;">🎉 LIKELY TO BE APPROVED</h2>
-                        <p style="color: #155724; font-size: 18px; margin: 10px 0;">Your loan application shows strong indicators for approval!</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown("""
-                    <div style="background-color: #f8d7da; border: 2px solid #dc3545; border-radius: 10px; padding: 20px; text-align: center; margin: 20px 0;">
-                        <h2 style="color: #721c24; margin: 0;">⚠️ AT RISK OF REJECTION</h2>
-                        <p style="color: #721c24; font-size: 18px; margin: 10px 0;">Your application may need improvements to increase approval chances.</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                st.markdown("---")
-                st.markdown("### 🔍 Your Personalized Loan Application Insights")
-
-                # Display feature importance as a bar chart with explanatory text
-                st.subheader("Factors Affecting Your Application")
-                st.write("These factors have the most impact on your loan approval chances:")
-                try:
-                    feat_df = pd.DataFrame.from_dict(feature_importance, orient='index', columns=['Importance'])
-                    feat_df = feat_df.sort_values('Importance', ascending=False)
-                    st.bar_chart(feat_df)
-                except Exception as e:
-                    st.error(f"❌ Error displaying feature importance: {e}")
-
-                # Display initial insights with better formatting
-                st.markdown("### 📝 Personalized Recommendations")
-                st.markdown(initial_insights)
-
-                # Chat interface for follow-up questions
-                st.markdown("### 💬 Ask Questions About Your Application")
-                st.write("Have questions about your loan application? Ask our loan advisor for personalized guidance.")
-
-                # Chat interface for follow-up questions
-
-                # Initialize chat session
-                initialize_chat_session()
-
-                # Display chat history
-                display_chat_history()
-
-                # Generate comprehensive context for chat
-                context = f"""🏦 LOAN APPLICATION ANALYSIS CONTEXT
-
-📊 PREDICTION RESULT:
-- Model Prediction: {'LIKELY TO BE APPROVED' if prediction == 0 else 'AT RISK OF REJECTION'}
-- Confidence Level: Based on ML model analysis
-
-👤 APPLICANT PROFILE:
-- Name: {user_data.get('borrower_name', 'N/A')}
-- Age: {user_data.get('person_age', 'N/A')} years
-- Annual Income: ₹{user_data.get('original_income_inr', 'N/A'):,}
-- Employment Length: {user_data.get('person_emp_length', 'N/A')} years
-- Credit History Length: {user_data.get('cb_person_cred_hist_length', 'N/A')} years
-- CIBIL Score: {user_data.get('cibil_score', 'N/A')}
-- Home Ownership: {user_data.get('person_home_ownership', 'N/A')}
-
-💰 LOAN DETAILS:
-- Requested Amount: ₹{user_data.get('original_loan_amnt_inr', 'N/A'):,}
-- Loan Purpose: {user_data.get('loan_intent', 'N/A')}
-- Interest Rate: {user_data.get('loan_int_rate', 'N/A')}%
-- Loan Grade: {user_data.get('loan_grade', 'N/A')}
-- Total Existing Debt: ₹{user_data.get('total_debt_inr', 'N/A'):,}
-
-📈 FINANCIAL RATIOS:
-- Debt-to-Income (DTI) Ratio: {user_data.get('dti_ratio', 'N/A'):.2f}%
-- Loan-to-Value (LTV) Ratio: {user_data.get('ltv_ratio', 'N/A'):.2f}% if applicable
-- Property Value: ₹{user_data.get('property_value_inr', 'N/A'):,} (if applicable)
-
-🎯 SHAP FEATURE IMPORTANCE (Top Factors):
-{chr(10).join([f"- {feature}: {importance:.4f}" for feature, importance in list(feature_importance.items())[:5]])}
-
-💡 INITIAL ANALYSIS INSIGHTS:
-{initial_insights}
-
-🔍 CONTEXT FOR CHAT:
-This data represents a comprehensive loan application analysis. The SHAP feature importance shows which factors most significantly impact the loan approval decision. The financial ratios provide key metrics lenders consider. Use this context to provide specific, actionable advice to the borrower."""
 
-                # Handle chat interaction
-                try:
-                    handle_chat_interaction(context)
-                except Exception as e:
-                    st.error(f"❌ Error in chat interaction: {e}")
-                    import traceback
-                    st.error(traceback.format_exc())
+                # Render from session state; on the analysis pass it was just filled in above,
+                # so there's no need for an extra st.rerun()
+                _render_results(
+                    st.session_state.prediction,
+                    st.session_state.feature_importance,
+                    st.session_state.user_data,
+                    st.session_state.initial_insights
+                )
 
             except Exception as e:
                 st.error(f"❌ Error during assessment: {e}")
-                import traceback
                 st.error(traceback.format_exc())
         else:
             st.error("Model is not loaded. Cannot perform prediction.")
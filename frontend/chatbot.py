@@ -1,11 +1,70 @@
 import sys
 import os
+import uuid
+import logging
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from backend.backend import LoanInsightsGenerator
-from backend.database_service import DatabaseService
+from backend.database_service import DatabaseService, start_session_sweeper
 from backend.config import GROQ_API_KEY
 
+# Messages shown as individual chat bubbles; older ones are collapsed into one element
+_RECENT_MESSAGES = 10
+
+@st.cache_resource
+def get_db_service():
+    """Shared DatabaseService; its scoped session gives each script thread its own DB session"""
+    # Every entry point reaches the database through here, so the expired-session sweeper starts here too
+    start_session_sweeper()
+    return DatabaseService()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_chat_history(user_id, limit):
+    """Recent chat history for a user, reused across reruns for a minute"""
+    return get_db_service().get_chat_history(user_id, limit=limit)
+
+@st.cache_resource
+def get_executor():
+    """Thread pool for chat writes that shouldn't hold up the rerun"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-save")
+
+def _save_chat_turn(rows):
+    """Persist one chat turn from a pool thread, releasing that thread's DB session afterwards"""
+    # Runs outside the script thread, so build the (cheap) service directly rather than via st.cache_resource
+    with DatabaseService() as db_service:
+        return db_service.save_chat_messages(rows)
+
+def _log_failed_save(future):
+    """Log a failed background save, so it is recorded even if no later rerun reports it"""
+    try:
+        save_result = future.result()
+    except Exception as e:
+        logging.error(f"Background chat save failed: {e}")
+        return
+    if not save_result["success"]:
+        logging.error(f"Background chat save failed: {save_result['message']}")
+
+def _check_pending_saves():
+    """Report every background save that has finished since the last rerun, without blocking"""
+    pending = st.session_state.get('pending_chat_saves')
+    if not pending:
+        return
+    still_running = []
+    for future in pending:
+        if not future.done():
+            still_running.append(future)
+            continue
+        try:
+            save_result = future.result()
+            if not save_result["success"]:
+                st.error(f"Failed to save chat messages: {save_result['message']}")
+        except Exception as e:
+            st.error(f"Failed to save chat message: {e}")
+    if len(still_running) != len(pending):
+        _cached_chat_history.clear()
+    st.session_state.pending_chat_saves = still_running
+
 def initialize_chat_session():
     """Initialize chat session state variables"""
     if 'chat_history' not in st.session_state:
@@ -13,10 +72,6 @@ def initialize_chat_session():
     
     if 'current_session_id' not in st.session_state:
         st.session_state.current_session_id = None
-    
-    # Initialize database service
-    if 'db_service' not in st.session_state:
-        st.session_state.db_service = DatabaseService()
 
 def display_chat_history():
     """Display existing chat messages"""
@@ -24,8 +79,7 @@ def display_chat_history():
     user_id = st.session_state.get('user_id')
     if user_id and 'chat_history_loaded' not in st.session_state and not st.session_state.current_session_id:
         try:
-            db_service = st.session_state.db_service
-            result = db_service.get_chat_history(user_id, limit=20)
+            result = _cached_chat_history(user_id, 20)
             if result["success"]:
                 # Convert database format to display format
                 st.session_state.chat_history = [
@@ -36,13 +90,26 @@ def display_chat_history():
         except Exception as e:
             st.error(f"Failed to load chat history: {e}")
     
+    # Streamlit rebuilds every element on each rerun, so keep the per-message elements to the
+    # recent tail and fold everything older into a single markdown element
+    history = st.session_state.chat_history
+    older, recent = history[:-_RECENT_MESSAGES], history[-_RECENT_MESSAGES:]
+    if older:
+        with st.expander(f"Earlier messages ({len(older)})"):
+            st.markdown("\n\n---\n\n".join(
+                f"**{'You' if message['role'] == 'user' else 'Assistant'}:** {message['content']}"
+                for message in older
+            ))
+    
     # Display chat messages
-    for message in st.session_state.chat_history:
+    for message in recent:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
 def handle_chat_interaction(context):
     """Handle chat input and generate AI responses"""
+    _check_pending_saves()
+    
     # Chat input
     if prompt := st.chat_input("Ask a question about your loan application"):
         # Get user info from session
@@ -69,22 +136,18 @@ def handle_chat_interaction(context):
         # Add AI response to chat history
         st.session_state.chat_history.append({"role": "assistant", "content": response})
         
-        # Save messages to database immediately
+        # Save messages in the background so the response renders without waiting on the write
+        # Use current session ID if available, otherwise use user session token
+        chat_session_id = st.session_state.current_session_id or session_id
         try:
-            db_service = st.session_state.db_service
-            # Use current session ID if available, otherwise use user session token
-            chat_session_id = st.session_state.current_session_id or session_id
-            
-            # Save user message
-            user_msg_result = db_service.save_chat_message(user_id, chat_session_id, "user", prompt)
-            if not user_msg_result["success"]:
-                st.error(f"Failed to save user message: {user_msg_result['message']}")
-            
-            # Save assistant response
-            assistant_msg_result = db_service.save_chat_message(user_id, chat_session_id, "assistant", response)
-            if not assistant_msg_result["success"]:
-                st.error(f"Failed to save assistant message: {assistant_msg_result['message']}")
-                
+            future = get_executor().submit(_save_chat_turn, [
+                {"user_id": user_id, "session_id": chat_session_id, "role": "user", "content": prompt},
+                {"user_id": user_id, "session_id": chat_session_id, "role": "assistant", "content": response}
+            ])
+            future.add_done_callback(_log_failed_save)
+            if 'pending_chat_saves' not in st.session_state:
+                st.session_state.pending_chat_saves = []
+            st.session_state.pending_chat_saves.append(future)
         except Exception as e:
             st.error(f"Failed to save chat message: {e}")
 
@@ -93,15 +156,17 @@ def start_new_chat():
     # Clear current chat history
     st.session_state.chat_history = []
     st.session_state.chat_history_loaded = False
+    _cached_chat_history.clear()
     
     # Generate a new session ID for this chat
-    import uuid
     st.session_state.current_session_id = str(uuid.uuid4())
     
     # Reset analysis state to start fresh
     st.session_state.analysis_done = False
     st.session_state.prediction = None
     st.session_state.feature_importance = None
+    st.session_state.feat_df = None
+    st.session_state.chat_context = None
     st.session_state.user_data = None
     st.session_state.initial_insights = None
     st.session_state.analysis_id = None
@@ -2,14 +2,38 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import streamlit as st
-import re
-from backend.database_service import DatabaseService
+import string
+from functools import lru_cache
 
+# Session state keys and their initial values
+_SESSION_DEFAULTS = (('page', 'home'), ('logged_in', False))
 
+# Maps every ASCII uppercase letter, lowercase letter and digit to a class marker
+_PASSWORD_CLASSES = str.maketrans(
+    string.ascii_uppercase + string.ascii_lowercase + string.digits,
+    'U' * 26 + 'L' * 26 + 'D' * 10
+)
+
+# Deletion tables for the allowed email characters: a part is valid when translate() leaves nothing
+_EMAIL_LOCAL_STRIP = str.maketrans('', '', string.ascii_letters + string.digits + '._%+-')
+_EMAIL_DOMAIN_STRIP = str.maketrans('', '', string.ascii_letters + string.digits + '.-')
+
+
+def get_db():
+    """The app-wide DatabaseService from chatbot.get_db_service"""
+    # Imported here so the static homepage renders without loading SQLAlchemy and bcrypt
+    from frontend.chatbot import get_db_service
+    return get_db_service()
+
+
+@lru_cache(maxsize=256)
 def validate_email(email):
-    """Simple email validation"""
-    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(email_regex, email) is not None
+    """Simple email validation: local@domain.tld with a letters-only TLD of 2+ characters"""
+    local, at, domain = email.partition('@')
+    if not at or not local or local.translate(_EMAIL_LOCAL_STRIP) or domain.translate(_EMAIL_DOMAIN_STRIP):
+        return False
+    host, dot, tld = domain.rpartition('.')
+    return bool(dot and host) and len(tld) >= 2 and tld.isascii() and tld.isalpha()
 
 
 def validate_password(password):
@@ -20,56 +44,76 @@ def validate_password(password):
     - Contains at least one lowercase letter
     - Contains at least one number
     """
-    return (
-            len(password) >= 8 and
-            any(c.isupper() for c in password) and
-            any(c.islower() for c in password) and
-            any(c.isdigit() for c in password)
-    )
+    if len(password) < 8:
+        return False
+    if password.isascii():
+        # Common case: one C-level translate to class markers, then three substring checks
+        classes = password.translate(_PASSWORD_CLASSES)
+        return 'U' in classes and 'L' in classes and 'D' in classes
+    # Non-ASCII passwords keep the Unicode-aware character classes, in one pass
+    # that records each class as a bit and stops once all three are seen
+    flags = 0
+    for c in password:
+        if c.isupper():
+            flags |= 1
+        elif c.islower():
+            flags |= 2
+        elif c.isdigit():
+            flags |= 4
+        if flags == 7:
+            return True
+    return False
 
 
-def login_page():
-    """Login page UI"""
-    st.title("🏦Login to Finsage")
+def _nav_button(label, page, key=None):
+    """Button that switches to another page when clicked"""
+    if st.button(label, key=key):
+        st.session_state.page = page
+        st.rerun()
 
-    # Initialize database
-    db = DatabaseService()
 
-    # Login form
+@st.fragment
+def _login_form():
+    """Login form; validation and the DB call only run on submit"""
     with st.form("login_form"):
         username = st.text_input("Username")
         password = st.text_input("Password", type="password")
         login_button = st.form_submit_button("Login")
 
-        if login_button:
-            if not username or not password:
-                st.error("Please fill in all fields")
-            else:
-                result = db.login_user(username, password)
-                if result["success"]:
-                    # Store login state
-                    st.session_state.logged_in = True
-                    st.session_state.username = result["username"]
-                    st.session_state.user_id = result["user_id"]
-                    st.session_state.session_token = result["session_token"]
-                    st.rerun()
-                else:
-                    st.error(result["message"])
+        if not login_button:
+            return
 
-    # Signup link
-    if st.button("Create New Account"):
-        st.session_state.page = 'signup'
-        st.rerun()
+        username = username.strip()
+        if not username or not password:
+            st.error("Please fill in all fields")
+            return
 
+        result = get_db().login_user(username, password)
+        if result["success"]:
+            # Store login state; st.rerun() from a fragment reruns the whole app by default
+            st.session_state.logged_in = True
+            st.session_state.username = result["username"]
+            st.session_state.user_id = result["user_id"]
+            st.session_state.session_token = result["session_token"]
+            st.rerun()
+        else:
+            st.error(result["message"])
 
-def signup_page():
-    """Signup page UI"""
-    st.title("🏦 Loan Approval Prediction App - Sign Up")
 
-    # Initialize database
-    db = DatabaseService()
+def login_page():
+    """Login page UI"""
+    st.title("🏦Login to Finsage")
 
-    # Signup form
+    # Login form
+    _login_form()
+
+    # Signup link
+    _nav_button("Create New Account", 'signup')
+
+
+@st.fragment
+def _signup_form():
+    """Signup form; validation and the DB call only run on submit"""
     with st.form("signup_form"):
         new_username = st.text_input("Choose a Username")
         email = st.text_input("Email Address")
@@ -77,157 +121,174 @@ def signup_page():
         confirm_password = st.text_input("Confirm Password", type="password")
         signup_button = st.form_submit_button("Sign Up")
 
-        if signup_button:
-            # Validation checks
-            if not new_username or not email or not new_password or not confirm_password:
-                st.error("Please fill in all fields")
-            elif not validate_email(email):
-                st.error("Invalid email address")
-            elif not validate_password(new_password):
-                st.error("Password must be at least 8 characters long and contain uppercase, lowercase, and number")
-            elif new_password != confirm_password:
-                st.error("Passwords do not match")
+        if not signup_button:
+            return
+
+        new_username = new_username.strip()
+        email = email.strip().lower()
+
+        # Validation checks
+        if not new_username or not email or not new_password or not confirm_password:
+            st.error("Please fill in all fields")
+        elif not validate_email(email):
+            st.error("Invalid email address")
+        elif not validate_password(new_password):
+            st.error("Password must be at least 8 characters long and contain uppercase, lowercase, and number")
+        elif new_password != confirm_password:
+            st.error("Passwords do not match")
+        else:
+            # Attempt to register user
+            result = get_db().register_user(new_username, email, new_password)
+            if result["success"]:
+                st.success("Account created successfully! Please log in.")
+                st.session_state.page = 'login'
+                st.rerun()
             else:
-                # Attempt to register user
-                result = db.register_user(new_username, email, new_password)
-                if result["success"]:
-                    st.success("Account created successfully! Please log in.")
-                    st.session_state.page = 'login'
-                    st.rerun()
-                else:
-                    st.error(result["message"])
+                st.error(result["message"])
+
+
+def signup_page():
+    """Signup page UI"""
+    st.title("🏦 Loan Approval Prediction App - Sign Up")
+
+    # Signup form
+    _signup_form()
 
     # Back to login
-    if st.button("Back to Login"):
-        st.session_state.page = 'login'
-        st.rerun()
+    _nav_button("Back to Login", 'login')
+
+
+_HOMEPAGE_CSS = """
+<style>
+.finsage-header {
+    font-size: 2.7rem;
+    font-weight: 800;
+    color: #2563eb;
+    text-align: center;
+    margin-top: 30px;
+    margin-bottom: 8px;
+    letter-spacing: -1px;
+}
+.finsage-tagline {
+    font-size: 1.15rem;
+    color: #3b4a5a;
+    text-align: center;
+    margin-bottom: 30px;
+}
+.feature-row {
+    display: flex;
+    justify-content: center;
+    gap: 32px;
+    margin-bottom: 30px;
+}
+.feature-card {
+    background: #fff;
+    border-radius: 16px;
+    padding: 28px 24px;
+    box-shadow: 0 4px 24px rgba(44,62,80,0.10);
+    min-width: 260px;
+    max-width: 320px;
+    text-align: center;
+    border: 1px solid #e6eaf1;
+    transition: box-shadow 0.2s;
+}
+.feature-card:hover {
+    box-shadow: 0 8px 32px rgba(44,62,80,0.16);
+}
+.feature-icon {
+    font-size: 2.2rem;
+    margin-bottom: 10px;
+}
+.feature-title {
+    font-size: 1.15rem;
+    font-weight: 700;
+    color: #1a2639;
+    margin-bottom: 6px;
+}
+.feature-desc {
+    color: #4e5d6c;
+    font-size: 1rem;
+}
+/* Style Streamlit buttons */
+div.stButton > button {
+    background-color: #2563eb;
+    color: #fff;
+    border-radius: 8px;
+    font-size: 1.1rem;
+    font-weight: 600;
+    padding: 12px 36px;
+    margin: 0 12px;
+    border: none;
+    transition: background 0.2s;
+}
+div.stButton > button:hover {
+    background-color: #1746a2;
+    color: #fff;
+}
+</style>
+"""
+
+_HOMEPAGE_HEADER = """
+<div class="finsage-header">FinSage: Explainable AI Loan Approval</div>
+<div class="finsage-tagline">Instant, transparent, and actionable loan insights powered by AI and explainable machine learning.</div>
+"""
+
+_HOMEPAGE_CARDS = """
+<div class="feature-row">
+    <div class="feature-card">
+        <div class="feature-icon">🔍</div>
+        <div class="feature-title">Explainable ML Decisions</div>
+        <div class="feature-desc">Get clear approval/rejection reasons with SHAP-based feature importance for every application.</div>
+    </div>
+    <div class="feature-card">
+        <div class="feature-icon">🤖</div>
+        <div class="feature-title">AI Financial Assistant</div>
+        <div class="feature-desc">Chat with an AI advisor for personalized financial guidance and Q&A.</div>
+    </div>
+    <div class="feature-card">
+        <div class="feature-icon">🔒</div>
+        <div class="feature-title">Secure & Private</div>
+        <div class="feature-desc">Your data is protected with strong encryption, session tokens, and user isolation.</div>
+    </div>
+</div>
+"""
+
+
+def _compact_html(html):
+    """Drop indentation and blank lines from an HTML snippet"""
+    return "\n".join(line.strip() for line in html.splitlines() if line.strip())
+
+
+# The static part of the homepage, assembled and compacted once at import; the blocks stay
+# separated by a blank line so markdown still treats each one as its own HTML block
+_HOMEPAGE_HTML = "\n\n".join(
+    _compact_html(block) for block in (_HOMEPAGE_CSS, _HOMEPAGE_HEADER, _HOMEPAGE_CARDS)
+)
+
+
+def _centered_two_col():
+    """Two equal columns inside the middle half of the page"""
+    return st.columns([1, 2, 1])[1].columns([1, 1])
 
 
 def homepage():
-    st.markdown("""
-        <style>
-        .finsage-header {
-            font-size: 2.7rem;
-            font-weight: 800;
-            color: #2563eb;
-            text-align: center;
-            margin-top: 30px;
-            margin-bottom: 8px;
-            letter-spacing: -1px;
-        }
-        .finsage-tagline {
-            font-size: 1.15rem;
-            color: #3b4a5a;
-            text-align: center;
-            margin-bottom: 30px;
-        }
-        .feature-row {
-            display: flex;
-            justify-content: center;
-            gap: 32px;
-            margin-bottom: 30px;
-        }
-        .feature-card {
-            background: #fff;
-            border-radius: 16px;
-            padding: 28px 24px;
-            box-shadow: 0 4px 24px rgba(44,62,80,0.10);
-            min-width: 260px;
-            max-width: 320px;
-            text-align: center;
-            border: 1px solid #e6eaf1;
-            transition: box-shadow 0.2s;
-        }
-        .feature-card:hover {
-            box-shadow: 0 8px 32px rgba(44,62,80,0.16);
-        }
-        .feature-icon {
-            font-size: 2.2rem;
-            margin-bottom: 10px;
-        }
-        .feature-title {
-            font-size: 1.15rem;
-            font-weight: 700;
-            color: #1a2639;
-            margin-bottom: 6px;
-        }
-        .feature-desc {
-            color: #4e5d6c;
-            font-size: 1rem;
-        }
-        .center-btn-row {
-            display: flex;
-            justify-content: center;
-            gap: 24px;
-            margin-top: 10px;
-            margin-bottom: 10px;
-        }
-        /* Style Streamlit buttons */
-        div.stButton > button {
-            background-color: #2563eb;
-            color: #fff;
-            border-radius: 8px;
-            font-size: 1.1rem;
-            font-weight: 600;
-            padding: 12px 36px;
-            margin: 0 12px;
-            border: none;
-            transition: background 0.2s;
-        }
-        div.stButton > button:hover {
-            background-color: #1746a2;
-            color: #fff;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-    st.markdown('<div class="finsage-header">FinSage: Explainable AI Loan Approval</div>', unsafe_allow_html=True)
-    st.markdown('<div class="finsage-tagline">Instant, transparent, and actionable loan insights powered by AI and explainable machine learning.</div>', unsafe_allow_html=True)
-
-    st.markdown("""
-        <div class="feature-row">
-            <div class="feature-card">
-                <div class="feature-icon">🔍</div>
-                <div class="feature-title">Explainable ML Decisions</div>
-                <div class="feature-desc">Get clear approval/rejection reasons with SHAP-based feature importance for every application.</div>
-            </div>
-            <div class="feature-card">
-                <div class="feature-icon">🤖</div>
-                <div class="feature-title">AI Financial Assistant</div>
-                <div class="feature-desc">Chat with an AI advisor for personalized financial guidance and Q&A.</div>
-            </div>
-            <div class="feature-card">
-                <div class="feature-icon">🔒</div>
-                <div class="feature-title">Secure & Private</div>
-                <div class="feature-desc">Your data is protected with strong encryption, session tokens, and user isolation.</div>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown(_HOMEPAGE_HTML, unsafe_allow_html=True)
 
     # Centered blue Streamlit buttons
-    st.markdown('<div class="center-btn-row">', unsafe_allow_html=True)
-    center = st.columns([1, 2, 1])[1]
-    with center:
-        btn1, btn2 = st.columns([1, 1])
-        with btn1:
-            if st.button("Login", key="login_btn_home"):
-                st.session_state.page = 'login'
-                st.rerun()
-        with btn2:
-            if st.button("Sign Up", key="signup_btn_home"):
-                st.session_state.page = 'signup'
-                st.rerun()
-    st.markdown('</div>', unsafe_allow_html=True)
+    btn1, btn2 = _centered_two_col()
+    with btn1:
+        _nav_button("Login", 'login', key="login_btn_home")
+    with btn2:
+        _nav_button("Sign Up", 'signup', key="signup_btn_home")
 
 
 def main():
     """Main application flow"""
     # Initialize session state variables if not exist
-    if 'page' not in st.session_state:
-        st.session_state.page = 'home'
-
-    if 'logged_in' not in st.session_state:
-        st.session_state.logged_in = False
+    session_state = st.session_state
+    for key, default in _SESSION_DEFAULTS:
+        if key not in session_state:
+            session_state[key] = default
 
     # Routing based on session state
     if st.session_state.logged_in: